@@ -4,11 +4,25 @@ Advanced Publication-Quality MD Simulation Analysis
 With Statistical Comparisons and Distribution Analysis
 """
 
+import argparse
+import gc
+import io
+import mmap
+import re
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # figures are only saved to disk; skip GUI backend setup
 import matplotlib.pyplot as plt
+from matplotlib import font_manager
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from matplotlib.gridspec import GridSpec
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import takewhile
 from pathlib import Path
-from scipy import stats
+from scipy.stats import ttest_ind
 
 # Publication settings
 plt.rcParams.update({
@@ -19,8 +33,14 @@ plt.rcParams.update({
     'ytick.major.width': 1.2,
     'figure.dpi': 300,
     'savefig.dpi': 600,
+    'svg.fonttype': 'none',
+    'path.simplify_threshold': 1.0,
+    'svg.hashsalt': '',  # deterministic element ids
 })
 
+# Resolve the font once up front rather than on the first draw
+font_manager.findfont('Arial')
+
 COLORS = {
     'apo': '#2E86AB',
     'test': '#A23B72',
@@ -33,60 +53,148 @@ LABELS = {
     'standard': 'Acarbose'
 }
 
+# Traces longer than this are rasterized in vector output
+RASTERIZE_MIN_POINTS = 10000
 
-def read_xvg(filename):
-    """Read GROMACS .xvg file"""
-    data_lines = []
+# Box-plot whiskers span the central 95% of the equilibrated values
+BOX_PERCENTILES = (2.5, 25, 50, 75, 97.5)
+
+# Output formats accepted for the main figure
+FIGURE_FORMATS = ('png', 'svg', 'svgz')
+
+# zlib level for PNG output (matplotlib's default is 6; 1 is several times faster)
+PNG_COMPRESS_LEVEL = 1
+
+# Unit conversion applied to each summary parameter (nm -> Å where needed)
+FACTORS = {
+    'RMSD (Å)': 10,
+    'Rg (Å)': 10,
+    'SASA (nm²)': 1
+}
+
+# '@ title "..."', '@ xaxis label "..."' and '@ yaxis label "..."' lines
+XVG_METADATA = re.compile(rb'^\s*@\s*(title|[xy]axis\s+label)\s+"([^"]*)"',
+                          re.MULTILINE | re.IGNORECASE)
+XVG_METADATA_KEYS = {b'title': 'title', b'xaxis': 'xlabel', b'yaxis': 'ylabel'}
+
+
+@lru_cache(maxsize=None)
+def _load_xvg(filename, mtime):
+    """Parse a GROMACS .xvg file; cached per (resolved path, mtime)"""
     metadata = {'title': '', 'xlabel': '', 'ylabel': ''}
     
-    with open(filename, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            
-            if line.startswith('@'):
-                if 'title' in line.lower():
-                    try: metadata['title'] = line.split('"')[1]
-                    except: pass
-                elif 'xaxis' in line.lower() and 'label' in line.lower():
-                    try: metadata['xlabel'] = line.split('"')[1]
-                    except: pass
-                elif 'yaxis' in line.lower() and 'label' in line.lower():
-                    try: metadata['ylabel'] = line.split('"')[1]
-                    except: pass
-                continue
-            
-            try:
-                values = [float(x) for x in line.split()]
-                data_lines.append(values)
-            except ValueError:
-                continue
-    
-    return np.array(data_lines), metadata
-
-
-def plot_with_stats(ax, files_dict, ylabel, title, convert_factor=1, time_ns=True):
+    # Scan only the preamble for metadata; the numeric body is left to numpy
+    with open(filename, 'rb') as f, \
+         mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header = b''.join(takewhile(
+            lambda line: not line.strip() or line.lstrip().startswith((b'#', b'@')),
+            iter(mm.readline, b'')))
+        body_start = len(header)
+        
+        for match in XVG_METADATA.finditer(header):
+            key = XVG_METADATA_KEYS[match.group(1).split()[0].lower()]
+            metadata[key] = match.group(2).decode(errors='replace')
+        
+        # C parser writes straight into a float64 buffer ('&' separates xmgrace sets)
+        data = np.loadtxt(io.BytesIO(mm[body_start:]), comments=('#', '@', '&'),
+                          dtype=np.float64, ndmin=2)
+    data.setflags(write=False)  # shared between callers via the cache
+    
+    return data, metadata
+
+
+def read_xvg(filename):
+    """Read GROMACS .xvg file (each file is parsed once until it changes)"""
+    path = Path(filename).resolve()
+    data, metadata = _load_xvg(str(path), path.stat().st_mtime_ns)
+    return data, dict(metadata)
+
+
+def release_xvg_cache():
+    """Drop the raw parsed .xvg arrays once their traces have been built"""
+    _load_xvg.cache_clear()
+    gc.collect()
+
+
+def preload_xvg(files, max_workers=8):
+    """Parse every .xvg file in parallel to warm the read cache"""
+    paths = [path for group in files.values() for path in group.values()]
+    
+    # Failures are not collected here; the plotting helpers skip or report them
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        for path in paths:
+            ex.submit(read_xvg, path)
+
+
+def prep_trace(data, convert_factor=1, time_scale=1):
+    """Scaled x and y columns of an .xvg array (float64, used for statistics)"""
+    return data[:, 0] * time_scale, data[:, 1] * convert_factor
+
+
+@dataclass(frozen=True)
+class TraceStats:
+    """Scaled float64 trace with statistics of its equilibrated part (last 50%)"""
+    x: np.ndarray
+    y: np.ndarray
+    eq_mean: float
+    eq_q: np.ndarray  # values at BOX_PERCENTILES
+
+    @property
+    def eq_values(self):
+        """Equilibrated float64 tail, e.g. for Welch's t-test"""
+        return self.y[len(self.y)//2:]
+
+
+@lru_cache(maxsize=None)
+def _trace_stats(filename, mtime, convert_factor, time_ns):
+    """Build TraceStats for a file; cached alongside the parsed data"""
+    data, _ = _load_xvg(filename, mtime)
+    x, y = prep_trace(data, convert_factor, 1e-3 if time_ns else 1)  # ps to ns
+    y = y.astype(np.float64, copy=False)
+    eq_values = y[len(y)//2:]
+    eq_q = np.percentile(eq_values, BOX_PERCENTILES).astype(np.float64, copy=False)
+    
+    # Shared through an unbounded cache, so every array is frozen
+    for arr in (x, y, eq_q):
+        arr.setflags(write=False)
+    return TraceStats(x, y, float(np.mean(eq_values, dtype=np.float64)), eq_q)
+
+
+def load_trace(filename, convert_factor=1, time_ns=True):
+    """Load a trace and its equilibrated statistics, computed once per file"""
+    path = Path(filename).resolve()
+    return _trace_stats(str(path), path.stat().st_mtime_ns, convert_factor, time_ns)
+
+
+def decimate(x, y, n=2000):
+    """Stride-downsample a trace to roughly n points, as float32 for plotting"""
+    step = max(1, len(y) // n)
+    return x[::step].astype(np.float32), y[::step].astype(np.float32)
+
+
+def plot_with_stats(ax, files_dict, ylabel, title, convert_factor=1, time_ns=True,
+                    max_points=2000):
     """Generic plotting function with statistics"""
     all_means = []
     
     for key, filepath in files_dict.items():
-        if filepath.exists():
-            data, _ = read_xvg(filepath)
-            if time_ns:
-                x = data[:, 0] / 1000  # to ns
-            else:
-                x = data[:, 0]
-            y = data[:, 1] * convert_factor
-            
-            ax.plot(x, y, label=LABELS[key], color=COLORS[key], 
-                   linewidth=1.5, alpha=0.85)
-            
-            # Mean of last 50%
-            mean_y = np.mean(y[len(y)//2:])
-            all_means.append((LABELS[key], mean_y))
-            ax.axhline(mean_y, color=COLORS[key], linestyle='--', 
-                      alpha=0.3, linewidth=1)
+        try:
+            trace = load_trace(filepath, convert_factor, time_ns)
+        except FileNotFoundError:
+            continue
+        
+        # Only time-series lines are downsampled (statistics use every frame);
+        # per-residue/atom profiles such as RMSF are always drawn in full
+        x_plot, y_plot = (decimate(trace.x, trace.y, max_points)
+                          if max_points and time_ns else (trace.x, trace.y))
+        ax.plot(x_plot, y_plot, label=LABELS[key], color=COLORS[key], 
+               linewidth=1.5, alpha=0.85,
+               rasterized=len(y_plot) > RASTERIZE_MIN_POINTS)
+        
+        # Mean of last 50%
+        all_means.append((LABELS[key], trace.eq_mean))
+        ax.axhline(trace.eq_mean, color=COLORS[key], linestyle='--', 
+                  alpha=0.3, linewidth=1)
     
     ax.set_xlabel('Time (ns)' if time_ns else 'Residue', fontweight='bold')
     ax.set_ylabel(ylabel, fontweight='bold')
@@ -102,50 +210,77 @@ def plot_with_stats(ax, files_dict, ylabel, title, convert_factor=1, time_ns=Tru
                bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
 
 
+def box_stats(trace, label):
+    """Box-plot statistics for ax.bxp from a trace's precomputed percentiles"""
+    lo, q1, med, q3, hi = trace.eq_q
+    return dict(label=label, whislo=lo, q1=q1, med=med, q3=q3, whishi=hi,
+                mean=trace.eq_mean, fliers=[])
+
+
 def create_box_plots(ax, param_name, files_dict, ylabel, convert_factor=1):
     """Create box plots for comparison"""
-    data_list = []
-    labels_list = []
+    traces = []
+    stats_list = []
     colors_list = []
     
     for key, filepath in files_dict.items():
-        if filepath.exists():
-            data, _ = read_xvg(filepath)
-            values = data[:, 1] * convert_factor
-            # Use equilibrated part (last 50%)
-            eq_values = values[len(values)//2:]
-            data_list.append(eq_values)
-            labels_list.append(LABELS[key])
-            colors_list.append(COLORS[key])
-    
-    if data_list:
-        bp = ax.boxplot(data_list, labels=labels_list, patch_artist=True,
-                       widths=0.6, showmeans=True,
-                       meanprops=dict(marker='D', markerfacecolor='red', 
-                                     markersize=6, markeredgecolor='darkred'))
+        try:
+            trace = load_trace(filepath, convert_factor)
+        except FileNotFoundError:
+            continue
+        
+        # Use equilibrated part (last 50%)
+        traces.append(trace)
+        stats_list.append(box_stats(trace, LABELS[key]))
+        colors_list.append(COLORS[key])
+    
+    if traces:
+        bp = ax.bxp(stats_list, patch_artist=True,
+                   widths=0.6, showmeans=True,
+                   meanprops=dict(marker='D', markerfacecolor='red', 
+                                 markersize=6, markeredgecolor='darkred'))
         
         # Color boxes
         for patch, color in zip(bp['boxes'], colors_list):
             patch.set_facecolor(color)
             patch.set_alpha(0.7)
         
-        # Perform statistical tests
-        if len(data_list) >= 2:
-            # T-test between test and standard
-            if len(data_list) >= 2:
-                t_stat, p_val = stats.ttest_ind(data_list[1], data_list[0])
-                ax.text(0.5, 0.98, f'p-value: {p_val:.4f}', 
-                       transform=ax.transAxes, ha='center', va='top',
-                       fontsize=9, bbox=dict(boxstyle='round', 
-                       facecolor='yellow' if p_val < 0.05 else 'white', alpha=0.7))
+        # Welch's t-test between the second and first group (unequal variances)
+        if len(traces) >= 2:
+            t_stat, p_val = ttest_ind(traces[1].eq_values, traces[0].eq_values,
+                                      equal_var=False)
+            ax.text(0.5, 0.98, f'p-value: {p_val:.4f}', 
+                   transform=ax.transAxes, ha='center', va='top',
+                   fontsize=9, bbox=dict(boxstyle='round', 
+                   facecolor='yellow' if p_val < 0.05 else 'white', alpha=0.7))
         
         ax.set_ylabel(ylabel, fontweight='bold')
         ax.grid(True, alpha=0.2, axis='y')
         ax.set_title(f'{param_name} Distribution', fontweight='bold', fontsize=10)
 
 
-def create_full_analysis():
-    """Create comprehensive analysis figure"""
+def reset_figure(fig, figsize):
+    """Clear and resize a reusable figure, creating it on first use"""
+    if fig is None:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+    else:
+        fig.clear()
+        fig.set_size_inches(figsize)
+    return fig
+
+
+def save_figure(fig, output):
+    """Save a figure at 600 DPI on white, with fast PNG compression"""
+    kwargs = {}
+    if output.endswith('.png'):
+        kwargs['pil_kwargs'] = {'compress_level': PNG_COMPRESS_LEVEL}
+    # Margins are fixed by each figure's layout, so no bbox_inches='tight' pass
+    fig.savefig(output, dpi=600, facecolor='white', **kwargs)
+
+
+def create_full_analysis(formats=('png', 'svg'), fig=None, max_points=2000):
+    """Create comprehensive analysis figure in each requested format"""
     
     # Define file paths
     files = {
@@ -175,8 +310,11 @@ def create_full_analysis():
         }
     }
     
+    print("Reading trajectory files...")
+    preload_xvg(files)
+    
     # Create main figure
-    fig = plt.figure(figsize=(18, 12))
+    fig = reset_figure(fig, (18, 12))
     gs = GridSpec(4, 3, figure=fig, hspace=0.4, wspace=0.35,
                   left=0.06, right=0.96, top=0.94, bottom=0.05)
     
@@ -186,7 +324,7 @@ def create_full_analysis():
     
     print("Analyzing RMSD...")
     plot_with_stats(ax1, files['rmsd'], 'RMSD (Å)', '(A) Root Mean Square Deviation', 
-                   convert_factor=10)
+                   convert_factor=10, max_points=max_points)
     create_box_plots(ax2, 'RMSD', files['rmsd'], 'RMSD (Å)', convert_factor=10)
     
     # Row 2: RMSF and Rg
@@ -204,7 +342,7 @@ def create_full_analysis():
     
     print("Analyzing Radius of Gyration...")
     plot_with_stats(ax5, files['rg'], 'Rg (Å)', '(C) Radius of Gyration', 
-                   convert_factor=10)
+                   convert_factor=10, max_points=max_points)
     create_box_plots(ax6, 'SASA', files['sasa'], 'SASA (nm²)')
     
     # Row 4: SASA and H-bonds
@@ -212,72 +350,91 @@ def create_full_analysis():
     ax8 = fig.add_subplot(gs[3, 2])
     
     print("Analyzing SASA...")
-    plot_with_stats(ax7, files['sasa'], 'SASA (nm²)', '(D) Solvent Accessible Surface Area')
+    plot_with_stats(ax7, files['sasa'], 'SASA (nm²)', '(D) Solvent Accessible Surface Area',
+                   max_points=max_points)
     
     print("Analyzing Hydrogen Bonds...")
-    plot_with_stats(ax8, files['hbonds'], 'H-bonds', '(E) Hydrogen Bonds', time_ns=True)
+    plot_with_stats(ax8, files['hbonds'], 'H-bonds', '(E) Hydrogen Bonds', time_ns=True,
+                   max_points=max_points)
+    
+    # Every panel now holds cached TraceStats (reused by the summary figure),
+    # so the float64 parse results only inflate peak memory while saving
+    release_xvg_cache()
     
     # Main title
     fig.suptitle('Comprehensive MD Simulation Analysis: α-Glucosidase with Berberine and Acarbose',
                  fontsize=15, fontweight='bold', y=0.98)
     
     # Save
-    output_png = 'MD_Complete_Analysis.png'
-    output_svg = 'MD_Complete_Analysis.svg'
-    
-    plt.savefig(output_png, dpi=600, bbox_inches='tight', facecolor='white')
-    plt.savefig(output_svg, format='svg', bbox_inches='tight', facecolor='white')
+    outputs = [f'MD_Complete_Analysis.{fmt}' for fmt in formats]
     
-    print(f"\n✓ Saved: {output_png}")
-    print(f"✓ Saved: {output_svg}")
+    print()
+    for output in outputs:
+        save_figure(fig, output)
+        print(f"✓ Saved: {output}")
     
-    plt.close()
-    
-    return output_png, output_svg
+    return outputs
 
 
-def create_summary_statistics():
+def create_summary_statistics(fig=None):
     """Create a separate statistics summary figure"""
     
     files_dict = {
         'RMSD (Å)': {'apo': Path('rmsd_apo.xvg'), 'test': Path('rmsd_test.xvg'), 
-                      'standard': Path('rmsd_standard.xvg'), 'factor': 10},
+                      'standard': Path('rmsd_standard.xvg')},
         'Rg (Å)': {'apo': Path('rg_apo.xvg'), 'test': Path('rg_test.xvg'), 
-                    'standard': Path('rg_standard.xvg'), 'factor': 10},
+                    'standard': Path('rg_standard.xvg')},
         'SASA (nm²)': {'apo': Path('sasa_apo.xvg'), 'test': Path('sasa_test.xvg'), 
-                        'standard': Path('sasa_standard.xvg'), 'factor': 1},
+                        'standard': Path('sasa_standard.xvg')},
     }
     
-    fig, axes = plt.subplots(1, 3, figsize=(15, 5))
+    fig = reset_figure(fig, (15, 5))
+    axes = fig.subplots(1, 3)
     fig.suptitle('Statistical Comparison of MD Parameters', fontsize=14, fontweight='bold')
     
-    for idx, (param_name, file_info) in enumerate(files_dict.items()):
-        factor = file_info.pop('factor')
-        create_box_plots(axes[idx], param_name, file_info, param_name, convert_factor=factor)
+    for idx, (param_name, paths) in enumerate(files_dict.items()):
+        create_box_plots(axes[idx], param_name, paths, param_name,
+                         convert_factor=FACTORS[param_name])
     
-    plt.tight_layout()
+    fig.subplots_adjust(left=0.06, right=0.98, top=0.88, bottom=0.15, wspace=0.3)
     output = 'MD_Statistics_Comparison.png'
-    plt.savefig(output, dpi=600, bbox_inches='tight', facecolor='white')
+    save_figure(fig, output)
     print(f"✓ Saved: {output}")
-    plt.close()
     
     return output
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Advanced MD Simulation Analysis')
+    parser.add_argument('--formats', default='png,svg',
+                        help='comma-separated formats for the main figure '
+                             f'({", ".join(FIGURE_FORMATS)}; default: png,svg)')
+    parser.add_argument('--full-traces', action='store_true',
+                        help='draw every trajectory frame instead of ~2000 points per '
+                             f'curve; traces over {RASTERIZE_MIN_POINTS} points are '
+                             'rasterized in vector output')
+    args = parser.parse_args()
+    
+    formats = [fmt.strip().lower() for fmt in args.formats.split(',') if fmt.strip()]
+    unknown = sorted(set(formats) - set(FIGURE_FORMATS))
+    if not formats or unknown:
+        parser.error(f"--formats must list one or more of {', '.join(FIGURE_FORMATS)}")
+    
     print("\n" + "="*70)
     print("Advanced MD Simulation Analysis")
     print("="*70 + "\n")
     
-    png1, svg1 = create_full_analysis()
+    # One figure and canvas are reused for both outputs
+    fig = reset_figure(None, (18, 12))
+    figures = create_full_analysis(formats, fig,
+                                   max_points=None if args.full_traces else 2000)
     print("\nCreating statistical comparisons...")
-    stats_fig = create_summary_statistics()
+    stats_fig = create_summary_statistics(fig)
     
     print("\n" + "="*70)
     print("Analysis Complete!")
     print("="*70)
     print("\nGenerated files:")
-    print(f"  1. {png1}")
-    print(f"  2. {svg1}")
-    print(f"  3. {stats_fig}")
+    for idx, output in enumerate([*figures, stats_fig], start=1):
+        print(f"  {idx}. {output}")
     print("\n✓ All figures are publication-ready (600 DPI)")